@@ -0,0 +1,127 @@
+"""
+Aggregates that can be computed over the objects matching a query, in the
+same spirit as Django's own aggregation API:
+
+from django_fluidinfo.models import Count, Min, Max
+
+Meeting.filter('has test/timestamp').aggregate(meetings=Count(),
+    first=Min('timestamp'), last=Max('timestamp'))
+
+Fluidinfo doesn't do any aggregation itself so the values are reduced on the
+client in a single pass over the parsed /values response, without
+instantiating a model for each result. Null (None) values are ignored.
+"""
+
+# The initial total of Min and Max (None is a value Fluidinfo can store)
+_EMPTY = object()
+
+
+def _is_number(value):
+    return isinstance(value, (int, long, float)) and not isinstance(value, bool)
+
+
+class Aggregate(object):
+    """
+    Base class for all aggregates. An aggregate starts with the "initial"
+    value and folds each tag value it is given into it using "reduce". The
+    final total is passed through "finish" to give the result.
+    """
+    initial = None
+
+    def __init__(self, field):
+        self.field = field
+
+    def reduce(self, total, value):
+        raise NotImplementedError
+
+    def finish(self, total):
+        return total
+
+    def __repr__(self):
+        return '%s(%r)' % (self.__class__.__name__, self.field)
+
+
+class Count(Aggregate):
+    """
+    The number of matching objects. If a field is given then only objects
+    that have a value for that field are counted
+    """
+    initial = 0
+
+    def __init__(self, field=None):
+        super(Count, self).__init__(field)
+
+    def reduce(self, total, value):
+        return total + 1
+
+
+class Min(Aggregate):
+    """
+    The smallest value of the field (or None if there are no values)
+    """
+    initial = _EMPTY
+
+    def reduce(self, total, value):
+        if total is _EMPTY or value < total:
+            return value
+        return total
+
+    def finish(self, total):
+        if total is _EMPTY:
+            return None
+        return total
+
+
+class Max(Min):
+    """
+    The largest value of the field (or None if there are no values)
+    """
+    def reduce(self, total, value):
+        if total is _EMPTY or value > total:
+            return value
+        return total
+
+
+class Sum(Aggregate):
+    """
+    The sum of the field's numeric values
+    """
+    initial = 0
+
+    def reduce(self, total, value):
+        if _is_number(value):
+            return total + value
+        return total
+
+
+class Histogram(Aggregate):
+    """
+    A dictionary mapping each of the field's values to the number of objects
+    with that value. If "bucket" is given then numeric values are grouped
+    into buckets of that width keyed by the bucket's lower bound (other
+    values are ignored). Each string in a set of strings value is counted
+    separately
+    """
+    def __init__(self, field, bucket=None):
+        super(Histogram, self).__init__(field)
+        self.bucket = bucket
+
+    @property
+    def initial(self):
+        return {}
+
+    def reduce(self, total, value):
+        if isinstance(value, (list, tuple)):
+            for item in value:
+                total = self.reduce(total, item)
+            return total
+        if self.bucket:
+            if not _is_number(value):
+                return total
+            value = (value // self.bucket) * self.bucket
+        total[value] = total.get(value, 0) + 1
+        return total
+
+    def __repr__(self):
+        return '%s(%r, bucket=%r)' % (self.__class__.__name__, self.field,
+            self.bucket)
@@ -86,17 +86,28 @@ def model_to_dict(instance, fields=None, exclude=None):
     return data
 
 
-def formfield_for_model_field(instance, field_name,
-        form_class=forms.FileField, **kwargs):
+def formfield_template_for_model_field(instance, field_name,
+        form_class=forms.FileField):
     """
-    Returns the appropriate form field type for a named field in an instance
+    Returns the form field class and keyword arguments used to create the
+    form field for a named field in an instance
     """
     field_type = instance.fields[field_name].field_type
     # Use FileField to represent the (default) opaque value on a form
     FormField = form_class
     if FORM_TYPES.has_key(field_type):
         FormField = FORM_TYPES[field_type]
-    formfield = FormField()
+    return FormField, {}
+
+
+def formfield_for_model_field(instance, field_name,
+        form_class=forms.FileField, **kwargs):
+    """
+    Returns the appropriate form field type for a named field in an instance
+    """
+    FormField, field_kwargs = formfield_template_for_model_field(instance,
+        field_name, form_class)
+    formfield = FormField(**field_kwargs)
     return formfield
 
 
@@ -111,26 +122,53 @@ def fields_for_model(instance, fields=None, exclude=None,
     ``exclude`` is an optional list of field names. If provided, the named
     fields will be excluded from the returned fields, even if they are listed
     in the ``fields`` argument.
-    """
+
+    Working out which form fields to use is only done once for each model and
+    combination of arguments (the result is kept on the model class) but new
+    form field instances are created every time, so form classes never share
+    them.
+    """
+    model = isinstance(instance, type) and instance or instance.__class__
+    # look in the class's own __dict__ so subclasses don't share the cache
+    cache = model.__dict__.get('_form_field_templates')
+    if cache is None:
+        cache = {}
+        model._form_field_templates = cache
+    key = (fields and tuple(fields), exclude and tuple(exclude),
+        formfield_callback)
+    if key not in cache:
+        cache[key] = _field_templates_for_model(instance, fields, exclude,
+            formfield_callback)
     field_list = []
-    ignored = []
+    for name, template in cache[key]:
+        formfield = None
+        if template:
+            FormField, field_kwargs = template
+            formfield = FormField(**field_kwargs)
+        field_list.append((name, formfield))
+    return SortedDict(field_list)
+
+
+def _field_templates_for_model(instance, fields=None, exclude=None,
+    formfield_callback=None):
+    """
+    Returns a list of (name, (form field class, keyword arguments)) pairs in
+    the order the form fields should appear.
+    """
+    template_list = []
     for f in instance.ordered_fields:
         if fields and not f in fields:
             continue
         if exclude and not f in exclude:
             continue
+        template_list.append((f, formfield_template_for_model_field(instance,
+            f)))
 
-        formfield = formfield_for_model_field(instance, f)
-        if formfield:
-            field_list.append((f, formfield))
-
-    field_dict = SortedDict(field_list)
     if fields:
-        field_dict = SortedDict(
-            [(f, field_dict.get(f)) for f in fields
+        templates = dict(template_list)
+        template_list = [(f, templates.get(f)) for f in fields
             if ((not exclude) or (exclude and f not in exclude))]
-            )
-    return field_dict
+    return template_list
 
 
 class ModelFormOptions(object):
@@ -168,6 +206,8 @@ class ModelFormMetaclass(type):
                 formfield_callback)
             # override default FOM Object's fields with any custom declared ones
             fields.update(declared_fields)
+        else:
+            fields = declared_fields
         new_class.declared_fields = declared_fields
         new_class.base_fields = fields
         return new_class
@@ -0,0 +1,198 @@
+"""
+Runs concurrent scenarios against an in-memory stand-in for Fluidinfo and
+reports the throughput, latency percentiles and request amplification (the
+number of HTTP requests made to Fluidinfo per operation) of each one.
+
+python manage.py loadtestfluidinfo --threads=20 --latency=50 render filter
+
+Nothing is sent to the real Fluidinfo: the session bound to FOM is replaced
+by one pointing at the stand-in for the duration of the run.
+"""
+import math
+import threading
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.datastructures import SortedDict
+from fom.session import Fluid
+
+from django_fluidinfo import models, forms
+from django_fluidinfo.standin import StandInServer
+
+
+class LoadTestMeeting(models.Model):
+    """
+    The model used by the scenarios
+    """
+    description = models.CharField('loadtest/description')
+    timestamp = models.IntegerField('loadtest/timestamp')
+
+
+class LoadTestMeetingForm(forms.ModelForm):
+    """
+    The form used by the scenarios
+    """
+    class Meta:
+        model = LoadTestMeeting
+
+
+def render_form(uid, sequence, options):
+    """
+    Renders a form for an existing object
+    """
+    meeting = LoadTestMeeting(uid)
+    LoadTestMeetingForm(instance=meeting).as_p()
+
+
+def submit_form(uid, sequence, options):
+    """
+    Validates and saves a form for an existing object. The data submitted is
+    different every time (a form whose data hasn't changed isn't cleaned)
+    """
+    meeting = LoadTestMeeting(uid)
+    data = {'description': 'submission %d' % sequence, 'timestamp': sequence}
+    form = LoadTestMeetingForm(data, instance=meeting)
+    if not form.is_valid():
+        raise ValueError(form.errors)
+    form.save()
+
+
+def page_filter(uid, sequence, options):
+    """
+    Pages through the results of a query reading every field. Fluidinfo
+    doesn't page results itself so the matching uids are fetched first and
+    then the fields of each page of objects are loaded with a request of its
+    own
+    """
+    uids = Fluid.bound.objects.get('has loadtest/timestamp').value['ids']
+    page_size = options['page_size']
+    for start in range(0, len(uids), page_size):
+        page = LoadTestMeeting.in_bulk(uids[start:start + page_size])
+        for meeting in page.values():
+            meeting.description
+            meeting.timestamp
+
+
+SCENARIOS = SortedDict([
+    ('render', render_form),
+    ('submit', submit_form),
+    ('filter', page_filter),
+])
+
+
+def percentile(values, percent):
+    """
+    Returns the nearest-rank percentile of a sorted list of values
+    """
+    if not values:
+        return 0
+    rank = int(math.ceil(percent / 100.0 * len(values)))
+    return values[min(max(rank, 1), len(values)) - 1]
+
+
+class Command(BaseCommand):
+    option_list = BaseCommand.option_list + (
+        make_option('--threads', '-t', type='int', dest='threads', default=10,
+            help='Number of concurrent threads per scenario'),
+        make_option('--iterations', '-n', type='int', dest='iterations',
+            default=20, help='Number of operations each thread performs'),
+        make_option('--latency', type='float', dest='latency', default=20,
+            help='Milliseconds the stand-in waits before each response'),
+        make_option('--objects', type='int', dest='objects', default=50,
+            help='Number of objects created in the stand-in before running'),
+        make_option('--page-size', type='int', dest='page_size', default=10,
+            help='Number of results per page in the filter scenario'),
+    )
+    help = 'Load tests django-fluidinfo against a local stand-in for Fluidinfo'
+    args = '[%s ...]' % ' '.join(SCENARIOS.keys())
+
+    def handle(self, *args, **options):
+        names = args or SCENARIOS.keys()
+        for name in names:
+            if name not in SCENARIOS:
+                raise CommandError('Unknown scenario: %s' % name)
+        if options['threads'] < 1 or options['iterations'] < 1:
+            raise CommandError('threads and iterations must be at least 1')
+        if options['objects'] < 1:
+            raise CommandError('objects must be at least 1')
+        if options['page_size'] < 1:
+            raise CommandError('page-size must be at least 1')
+        if options['latency'] < 0:
+            raise CommandError('latency must not be negative')
+        # every thread must be able to connect at once
+        server = StandInServer(latency=options['latency'] / 1000.0,
+            backlog=max(128, options['threads']))
+        server.start()
+        previous = getattr(Fluid, 'bound', None)
+        Fluid(server.url).bind()
+        try:
+            uids = self.seed(server, options['objects'])
+            self.stdout.write('%-8s %6s %6s %9s %8s %8s %8s %7s\n' % (
+                'scenario', 'ops', 'errors', 'ops/s', 'p50 ms', 'p95 ms',
+                'p99 ms', 'req/op'))
+            for name in names:
+                self.stdout.write(self.run(server, name, uids, options))
+        finally:
+            Fluid.bound = previous
+            server.stop()
+
+    def seed(self, server, count):
+        """
+        Creates the objects the scenarios work on directly in the stand-in
+        """
+        uids = []
+        for i in range(count):
+            uid = server.create_object('loadtest object %d' % i)
+            server.set_value(uid, 'loadtest/description', 'object %d' % i)
+            server.set_value(uid, 'loadtest/timestamp', i)
+            uids.append(uid)
+        return uids
+
+    def run(self, server, name, uids, options):
+        """
+        Runs a scenario in concurrent threads and returns a line of the report
+        """
+        scenario = SCENARIOS[name]
+        iterations = options['iterations']
+        latencies = []
+        errors = []
+        lock = threading.Lock()
+
+        def worker(index):
+            for i in range(iterations):
+                sequence = index * iterations + i
+                uid = uids[sequence % len(uids)]
+                started = time.time()
+                try:
+                    scenario(uid, sequence, options)
+                except Exception, e:
+                    lock.acquire()
+                    errors.append(e)
+                    lock.release()
+                    continue
+                elapsed = time.time() - started
+                lock.acquire()
+                latencies.append(elapsed)
+                lock.release()
+
+        requests = server.requests
+        started = time.time()
+        threads = [threading.Thread(target=worker, args=(i,))
+            for i in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.time() - started
+        requests = server.requests - requests
+        operations = len(latencies) + len(errors)
+        latencies.sort()
+        if errors and int(options.get('verbosity', 1)) > 1:
+            self.stderr.write('%s: %r\n' % (name, errors[0]))
+        return '%-8s %6d %6d %9.1f %8.1f %8.1f %8.1f %7.1f\n' % (name,
+            operations, len(errors), operations / elapsed,
+            percentile(latencies, 50) * 1000,
+            percentile(latencies, 95) * 1000,
+            percentile(latencies, 99) * 1000,
+            float(requests) / operations)
@@ -38,12 +38,22 @@ Fluidinfo.
 I expect them to dig into FOM once they grok what Fluidinfo is about. ;-)
 """
 
+from hashlib import md5
 
 try:
     from fom.mapping import Object, tag_value
+    from fom.session import Fluid
 except ImportError:
     raise ImportError("FOM must be in your Python path. See http://launchpad.net/fom for more information")
 
+from django_fluidinfo.aggregates import (Aggregate, Count, Min, Max, Sum,
+    Histogram)
+from django_fluidinfo.session import bind_lazily
+
+# Fluidinfo is only contacted (using the credentials in settings.py) the first
+# time a model is used
+bind_lazily()
+
 
 class ModelBase(type):
     """
@@ -58,14 +68,24 @@ class ModelBase(type):
             return super_new(cls, name, bases, attrs)
 
         # We want to be able to store away the field names and tags so the form
-        # class can make use of them later
+        # class can make use of them later. Fields inherited from parent models
+        # come first followed by those declared on this class.
         fields = {}
         ordered_fields = []
-        for field, tag in attrs.items():
-            if isinstance(tag, tag_value):
-                fields[field] = tag
+        for parent in parents:
+            for field in getattr(parent, 'ordered_fields', []):
+                if field not in fields:
+                    ordered_fields.append(field)
+                    fields[field] = parent.fields[field]
+        declared = [(field, tag) for field, tag in attrs.items()
+            if isinstance(tag, tag_value)]
+        # attrs doesn't remember the order in which the fields were declared
+        # but the fields themselves do
+        declared.sort(key=lambda item: getattr(item[1], 'creation_counter', -1))
+        for field, tag in declared:
+            if field not in fields:
                 ordered_fields.append(field)
-        ordered_fields.reverse()
+            fields[field] = tag
 
         # dictionary of tag names : tag values
         attrs['fields'] = fields
@@ -84,13 +104,253 @@ class Model(Object):
     """
     __metaclass__ = ModelBase
 
+    # ModelBase sets these for each subclass; Model itself has no fields
+    fields = {}
+    ordered_fields = []
+
+    # the most uids or about values in_bulk and in_bulk_about put in a single
+    # query (each is a clause in the /values URL, which mustn't get too long)
+    in_bulk_batch_size = 100
+
+    @classmethod
+    def filter(cls, query, result_type=None):
+        """
+        Returns a QuerySet of the objects that match the supplied query written
+        in Fluidinfo's query language. Nothing is fetched from Fluidinfo until
+        the results are used.
+
+        If result_type is passed the results will be instances of result_type
+        rather than cls. FOM's own filter is used if it isn't a Model.
+        """
+        model = result_type or cls
+        if not issubclass(model, Model):
+            return super(Model, cls).filter(query, result_type)
+        return QuerySet(model, query)
+
+    @classmethod
+    def in_bulk(cls, uids):
+        """
+        Returns a dictionary mapping each of the given object uids to an
+        instance of this model with all its fields already loaded.
+
+        A query is made to Fluidinfo for each batch of in_bulk_batch_size
+        uids. Uids that don't match an object are left out of the result.
+        """
+        uids = list(uids)
+        instances = dict((obj.uid, obj) for obj in
+            cls._load_in_batches('fluiddb/id', uids))
+        return dict((uid, instances[uid]) for uid in uids
+            if uid in instances)
+
+    @classmethod
+    def in_bulk_about(cls, abouts):
+        """
+        Returns a dictionary mapping each of the given about tag values to an
+        instance of this model with all its fields already loaded.
+
+        A query is made to Fluidinfo for each batch of in_bulk_batch_size
+        about values. About values that don't match an object are left out of
+        the result.
+        """
+        abouts = list(abouts)
+        instances = dict((obj.about, obj) for obj in
+            cls._load_in_batches('fluiddb/about', abouts))
+        return dict((about, instances[about]) for about in abouts
+            if about in instances)
+
+    @classmethod
+    def _load_in_batches(cls, tagpath, values):
+        """
+        Returns a list of instances of this model for the objects whose tag
+        matches one of the values, querying for in_bulk_batch_size values at
+        a time.
+        """
+        instances = []
+        size = cls.in_bulk_batch_size
+        for start in range(0, len(values), size):
+            query = ' or '.join(['%s = %s' % (tagpath, _quote(value))
+                for value in values[start:start + size]])
+            instances.extend(cls._load_values(query))
+        return instances
+
+    @classmethod
+    def _load_values(cls, query):
+        """
+        Returns a list of instances of this model for the objects matching
+        the query. The about tag and every declared field are fetched in the
+        same call to Fluidinfo's /values API.
+        """
+        tag_list = ['fluiddb/about', ]
+        tag_list.extend([cls.fields[f].tagpath for f in cls.ordered_fields])
+        response = Fluid.bound.values.get(query, tag_list)
+        return [cls(uid, initial=values, dirty=False) for uid, values in
+            response.value['results']['id'].iteritems()]
+
+
+class QuerySet(object):
+    """
+    The lazily evaluated collection of instances of a model matching a query.
+
+    It can be iterated over, indexed, sliced, compared with and added to a
+    list like the list previously returned by Model.filter and can also be
+    used to aggregate the values of the model's fields. Use list() for other
+    list operations.
+    """
+
+    def __init__(self, model, query, cache_timeout=None):
+        self.model = model
+        self.query = query
+        self.cache_timeout = cache_timeout
+        self._result_cache = None
+
+    def _fetch_all(self):
+        if self._result_cache is None:
+            self._result_cache = self.model._load_values(self.query)
+        return self._result_cache
+
+    def __iter__(self):
+        return iter(self._fetch_all())
+
+    def __len__(self):
+        return len(self._fetch_all())
+
+    def __getitem__(self, k):
+        return self._fetch_all()[k]
+
+    def __repr__(self):
+        return repr(self._fetch_all())
+
+    def __eq__(self, other):
+        if isinstance(other, (list, QuerySet)):
+            return self._fetch_all() == list(other)
+        return NotImplemented
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        if result is NotImplemented:
+            return result
+        return not result
+
+    def __add__(self, other):
+        return self._fetch_all() + list(other)
+
+    def __radd__(self, other):
+        return list(other) + self._fetch_all()
+
+    def cache(self, timeout):
+        """
+        Returns a copy of this QuerySet whose aggregates are stored in
+        Django's cache for "timeout" seconds.
+        """
+        if not timeout or timeout < 0:
+            # Django's cache treats 0 as "use the default timeout"
+            raise ValueError("The timeout must be a positive number of seconds")
+        return QuerySet(self.model, self.query, timeout)
+
+    def aggregate(self, **aggregates):
+        """
+        Returns a dictionary of the values of the given aggregates calculated
+        over the objects matching the query, e.g.
+
+        Meeting.filter(query).aggregate(count=Count(), last=Max('timestamp'))
+
+        Only the tags needed by the aggregates are requested from Fluidinfo
+        and no model instances are created. FOM parses the whole response
+        before the values are reduced in a single pass, so memory use grows
+        with the number of matching objects. Null values are ignored. If
+        cache() has been called the result is taken from, or stored in,
+        Django's cache.
+        """
+        if not aggregates:
+            return {}
+        for alias, aggregate in aggregates.items():
+            if not isinstance(aggregate, Aggregate):
+                raise TypeError("%s is not an aggregate" % alias)
+            if aggregate.field and aggregate.field not in self.model.fields:
+                raise ValueError("%s has no field named %s" %
+                    (self.model.__name__, aggregate.field))
+        if self.cache_timeout is None:
+            return self._compute(aggregates)
+        from django.core.cache import cache
+        key = self._cache_key(aggregates)
+        result = cache.get(key)
+        if result is None:
+            result = self._compute(aggregates)
+            cache.set(key, result, self.cache_timeout)
+        return result
+
+    def _cache_key(self, aggregates):
+        query = self.query
+        if isinstance(query, unicode):
+            query = query.encode('utf-8')
+        spec = '%s.%s|%s|%r' % (self.model.__module__, self.model.__name__,
+            query, sorted(aggregates.items()))
+        return 'django_fluidinfo.aggregate.%s' % md5(spec).hexdigest()
+
+    def _compute(self, aggregates):
+        """
+        Reduces the tag values of each matching object into the aggregates in
+        a single pass over the parsed response
+        """
+        reducers = []
+        tag_list = []
+        for alias, aggregate in aggregates.items():
+            tagpath = None
+            if aggregate.field:
+                tagpath = self.model.fields[aggregate.field].tagpath
+                if tagpath not in tag_list:
+                    tag_list.append(tagpath)
+            reducers.append((alias, aggregate, tagpath))
+        totals = dict((alias, aggregate.initial) for alias, aggregate, tagpath
+            in reducers)
+        if tag_list:
+            response = Fluid.bound.values.get(self.query, tag_list)
+            rows = response.value['results']['id'].itervalues()
+        else:
+            # only objects are being counted so no tag values are required
+            response = Fluid.bound.objects.get(self.query)
+            rows = ({} for uid in response.value['ids'])
+        for values in rows:
+            for alias, aggregate, tagpath in reducers:
+                if tagpath is None:
+                    value = None
+                elif values.get(tagpath, {}).get('value') is not None:
+                    value = values[tagpath]['value']
+                else:
+                    # the object doesn't have a (non-null) primitive value for
+                    # the tag
+                    continue
+                totals[alias] = aggregate.reduce(totals[alias], value)
+        return dict((alias, aggregate.finish(totals[alias])) for alias,
+            aggregate, tagpath in reducers)
+
+
+def _quote(value):
+    """
+    Returns the value as a string literal for use in a Fluidinfo query
+    """
+    return '"%s"' % value.replace('\\', '\\\\').replace('"', '\\"')
+
 
 # TagFields defined below just make it "nice" for djangonaughts to grok how
 # a tag attribute *should* behave in terms of type. It isn't enforced but it
 # means that the forms classes can work out how to display the related fields.
 
 
-class TagField(tag_value):
+class Field(tag_value):
+    """
+    Base class for the typed tag fields. Keeps count of the fields created so
+    a model can list its fields in the order they're declared in code
+    """
+    creation_counter = 0
+
+    def __init__(self, *args, **kwargs):
+        super(Field, self).__init__(*args, **kwargs)
+        self.creation_counter = Field.creation_counter
+        Field.creation_counter += 1
+
+
+class TagField(Field):
     """
     Represents a generic tag with no specifically pre-defined type
     """
@@ -100,7 +360,7 @@ class TagField(tag_value):
         return unicode
 
 
-class CharField(tag_value):
+class CharField(Field):
     """
     A tag that should contain a Fluidinfo "string" primitive type
     """
@@ -109,7 +369,7 @@ class CharField(tag_value):
         return unicode
 
 
-class IntegerField(tag_value):
+class IntegerField(Field):
     """
     A tag that should contain a Fluidinfo integer primitive type
     """
@@ -118,7 +378,7 @@ class IntegerField(tag_value):
         return int
 
 
-class FloatField(tag_value):
+class FloatField(Field):
     """
     A tag that should contain a Fluidinfo float primitive type
     """
@@ -127,7 +387,7 @@ class FloatField(tag_value):
         return float
 
 
-class BooleanField(tag_value):
+class BooleanField(Field):
     """
     A tag that should contain a Fluidinfo boolean primitive type
     """
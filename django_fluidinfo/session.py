@@ -0,0 +1,75 @@
+"""
+Lazily created FOM sessions.
+
+Rather than creating and logging in a FOM session when settings.py is loaded,
+django-fluidinfo binds a LazyFluid that only creates the real session the
+first time it's used. It's configured with the following (optional) settings:
+
+FLUIDINFO_URL = 'https://sandbox.fluidinfo.com' # defaults to the main instance
+FLUIDINFO_USERNAME = 'username'
+FLUIDINFO_PASSWORD = 'password'
+
+If a session has already been bound (for example, in settings.py as described
+in older versions of the documentation) then it is left alone.
+"""
+import threading
+
+from fom.db import BASE_URL
+from fom.session import Fluid
+
+
+def fluid_from_settings():
+    """
+    Returns a new FOM session for the instance of Fluidinfo and credentials
+    in Django's settings
+    """
+    from django.conf import settings
+    fluid = Fluid(getattr(settings, 'FLUIDINFO_URL', BASE_URL))
+    username = getattr(settings, 'FLUIDINFO_USERNAME', None)
+    if username:
+        fluid.login(username, getattr(settings, 'FLUIDINFO_PASSWORD', ''))
+    return fluid
+
+
+class LazyFluid(object):
+    """
+    Stands in for a FOM session, creating the real one with "factory" the
+    first time any of its attributes are used
+    """
+
+    def __init__(self, factory=fluid_from_settings):
+        self._factory = factory
+        self._fluid = None
+        self._lock = threading.Lock()
+
+    def _setup(self):
+        self._lock.acquire()
+        try:
+            if self._fluid is None:
+                self._fluid = self._factory()
+        finally:
+            self._lock.release()
+        return self._fluid
+
+    def __getattr__(self, name):
+        # only called for attributes not found on the LazyFluid itself
+        fluid = self._fluid
+        if fluid is None:
+            fluid = self._setup()
+        return getattr(fluid, name)
+
+    def bind(self):
+        """
+        Bind this lazy session to the global object mapper in place of a
+        real one
+        """
+        Fluid.bound = self
+
+
+def bind_lazily():
+    """
+    Binds a LazyFluid configured from Django's settings unless a session has
+    already been bound
+    """
+    if getattr(Fluid, 'bound', None) is None:
+        LazyFluid().bind()
@@ -0,0 +1,330 @@
+"""
+A stand-in for Fluidinfo that runs in a local thread and keeps everything in
+memory. It only understands the parts of the REST API that FOM uses for
+objects, tag-values and the /values API, and a subset of the query language
+(has, =, <, >, <=, >=, and, or, and parentheses).
+
+It's intended for exercising django-fluidinfo without a network connection,
+for example by the loadtestfluidinfo management command:
+
+from fom.session import Fluid
+from django_fluidinfo.standin import StandInServer
+
+server = StandInServer(latency=0.02) # simulate 20ms round trips
+server.start()
+Fluid(server.url).bind()
+...
+server.stop()
+
+Every request handled is counted in the server's "requests" attribute.
+"""
+import re
+import threading
+import time
+import urllib
+import urlparse
+import uuid
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+
+try:
+    import json
+except ImportError:
+    import simplejson as json
+
+
+PRIMITIVE_CONTENT_TYPE = 'application/vnd.fluiddb.value+json'
+
+# Returned by routes for responses without a body (None is a tag value)
+NO_CONTENT = object()
+
+TOKENS = re.compile(r'\s*(?:("(?:[^"\\]|\\.)*")|(<=|>=|=|<|>|\(|\))|'
+    r'([^\s()<>="]+))')
+
+
+class QueryError(ValueError):
+    """
+    Raised when the stand-in doesn't understand a query
+    """
+    pass
+
+
+def tokenize(query):
+    """
+    Splits a query into a list of tokens
+    """
+    tokens = []
+    position = 0
+    query = query.strip()
+    while position < len(query):
+        match = TOKENS.match(query, position)
+        if not match or match.end() == position:
+            raise QueryError("Cannot parse query: %s" % query)
+        string, operator, word = match.groups()
+        if string is not None:
+            string = re.sub(r'\\(.)', r'\1', string[1:-1])
+            tokens.append(('string', string))
+        elif operator is not None:
+            tokens.append(('op', operator))
+        else:
+            tokens.append(('word', word))
+        position = match.end()
+    return tokens
+
+
+class QueryParser(object):
+    """
+    Turns a list of tokens into a predicate that takes the uid and tag-values
+    of an object and returns whether the object matches the query
+    """
+    COMPARISONS = {
+        '=': lambda a, b: a == b,
+        '<': lambda a, b: a < b,
+        '>': lambda a, b: a > b,
+        '<=': lambda a, b: a <= b,
+        '>=': lambda a, b: a >= b,
+    }
+
+    def __init__(self, query):
+        self.tokens = tokenize(query)
+        self.position = 0
+
+    def parse(self):
+        predicate = self.parse_or()
+        if self.position != len(self.tokens):
+            raise QueryError("Unexpected %s" % self.tokens[self.position][1])
+        return predicate
+
+    def next(self):
+        if self.position >= len(self.tokens):
+            raise QueryError("Unexpected end of query")
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return (None, None)
+
+    def parse_or(self):
+        predicates = [self.parse_and()]
+        while self.peek() == ('word', 'or'):
+            self.next()
+            predicates.append(self.parse_and())
+        return lambda uid, tags: any(p(uid, tags) for p in predicates)
+
+    def parse_and(self):
+        predicates = [self.parse_term()]
+        while self.peek() == ('word', 'and'):
+            self.next()
+            predicates.append(self.parse_term())
+        return lambda uid, tags: all(p(uid, tags) for p in predicates)
+
+    def parse_term(self):
+        kind, value = self.next()
+        if (kind, value) == ('op', '('):
+            predicate = self.parse_or()
+            if self.next() != ('op', ')'):
+                raise QueryError("Missing )")
+            return predicate
+        if (kind, value) == ('word', 'has'):
+            kind, tagpath = self.next()
+            return lambda uid, tags: tagpath in tags
+        if kind != 'word':
+            raise QueryError("Unexpected %s" % value)
+        tagpath = value
+        kind, operator = self.next()
+        if kind != 'op' or operator not in self.COMPARISONS:
+            raise QueryError("Unsupported operator %s" % operator)
+        kind, literal = self.next()
+        if kind == 'word':
+            try:
+                literal = float(literal)
+            except ValueError:
+                raise QueryError("Invalid value %s" % literal)
+        compare = self.COMPARISONS[operator]
+        if tagpath == 'fluiddb/id':
+            return lambda uid, tags: compare(uid, literal)
+        return lambda uid, tags: (tagpath in tags and
+            compare(tags[tagpath], literal))
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Handles a single request to the stand-in
+    """
+    def log_message(self, format, *args):
+        # keep quiet
+        pass
+
+    def handle_request(self):
+        server = self.server
+        server.count_request()
+        if server.latency:
+            time.sleep(server.latency)
+        url = urlparse.urlparse(self.path)
+        path = [urllib.unquote(part) for part in url.path.split('/')[1:]]
+        args = urlparse.parse_qs(url.query)
+        length = int(self.headers.get('content-length') or 0)
+        body = length and self.rfile.read(length) or None
+        try:
+            status, content_type, value = self.route(path, args, body)
+        except (QueryError, ValueError, KeyError):
+            status, content_type, value = 400, 'application/json', NO_CONTENT
+        if value is NO_CONTENT:
+            content = ''
+        else:
+            content = json.dumps(value)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(content)
+
+    do_GET = do_PUT = do_POST = do_HEAD = do_DELETE = handle_request
+
+    def route(self, path, args, body):
+        """
+        Returns the status, content type and (JSON serializable) value of the
+        response to the request
+        """
+        server = self.server
+        method = self.command
+        payload = None
+        if body:
+            payload = json.loads(body)
+        not_found = (404, 'application/json', NO_CONTENT)
+        if path == ['objects']:
+            if method == 'POST':
+                uid = server.create_object(payload and payload.get('about'))
+                return 201, 'application/json', {'id': uid,
+                    'URI': '%s/objects/%s' % (server.url, uid)}
+            ids = server.query(args['query'][0])
+            return 200, 'application/json', {'ids': ids}
+        if len(path) == 2 and path[0] == 'objects':
+            tags = server.objects.get(path[1])
+            if tags is None:
+                return not_found
+            return 200, 'application/json', {'tagPaths': tags.keys()}
+        if len(path) > 2 and path[0] == 'objects':
+            uid, tagpath = path[1], '/'.join(path[2:])
+            if uid not in server.objects:
+                return not_found
+            if method == 'PUT':
+                server.set_value(uid, tagpath, payload)
+                return 204, 'application/json', NO_CONTENT
+            if method == 'DELETE':
+                server.delete_value(uid, tagpath)
+                return 204, 'application/json', NO_CONTENT
+            if tagpath not in server.objects[uid]:
+                return not_found
+            return 200, PRIMITIVE_CONTENT_TYPE, server.objects[uid][tagpath]
+        if path == ['values']:
+            if method == 'PUT':
+                for query, values in payload['queries']:
+                    for uid in server.query(query):
+                        for tagpath, value in values.items():
+                            server.set_value(uid, tagpath, value['value'])
+                return 204, 'application/json', NO_CONTENT
+            results = {}
+            for uid in server.query(args['query'][0]):
+                tags = server.objects[uid]
+                results[uid] = dict((tagpath, {'value': tags[tagpath]})
+                    for tagpath in args.get('tag', []) if tagpath in tags)
+            return 200, 'application/json', {'results': {'id': results}}
+        return not_found
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    """
+    An in-memory stand-in for Fluidinfo listening on localhost. "latency" is
+    the number of seconds to wait before answering each request. "backlog" is
+    the number of connections that can wait to be accepted, which should be
+    at least the number of clients using the stand-in at once (otherwise
+    connections are refused and the clients' retries are measured instead).
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, latency=0, port=0, backlog=128):
+        # used by server_activate, which HTTPServer.__init__ calls
+        self.request_queue_size = backlog
+        HTTPServer.__init__(self, ('127.0.0.1', port), StandInHandler)
+        self.latency = latency
+        self.requests = 0
+        # uid : {tag path : value}
+        self.objects = {}
+        # about tag value : uid
+        self.abouts = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address
+
+    def start(self):
+        """
+        Starts serving requests in a background thread
+        """
+        self.thread = threading.Thread(target=self.serve_forever)
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        self.thread.join()
+
+    def count_request(self):
+        self.lock.acquire()
+        try:
+            self.requests += 1
+        finally:
+            self.lock.release()
+
+    def create_object(self, about=None):
+        """
+        Returns the uid of the object with the given about tag value, creating
+        the object if required
+        """
+        self.lock.acquire()
+        try:
+            if about is not None and about in self.abouts:
+                return self.abouts[about]
+            uid = unicode(uuid.uuid4())
+            self.objects[uid] = {}
+            if about is not None:
+                self.objects[uid]['fluiddb/about'] = about
+                self.abouts[about] = uid
+            return uid
+        finally:
+            self.lock.release()
+
+    def set_value(self, uid, tagpath, value):
+        self.lock.acquire()
+        try:
+            self.objects[uid][tagpath] = value
+        finally:
+            self.lock.release()
+
+    def delete_value(self, uid, tagpath):
+        self.lock.acquire()
+        try:
+            self.objects[uid].pop(tagpath, None)
+        finally:
+            self.lock.release()
+
+    def query(self, query):
+        """
+        Returns the uids of the objects matching the query
+        """
+        predicate = QueryParser(query).parse()
+        self.lock.acquire()
+        try:
+            return [uid for uid, tags in self.objects.items()
+                if predicate(uid, tags)]
+        finally:
+            self.lock.release()
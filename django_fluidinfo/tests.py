@@ -1,10 +1,21 @@
+import imp
+import os
 import unittest
 import models
 import forms
+from StringIO import StringIO
+from django.conf import settings
 from django import forms as django_forms
+from django.core.management import call_command
 
 from fom.dev import sandbox_fluid
-from fom.mapping import Namespace
+from fom.mapping import Namespace, Object
+from fom.session import Fluid
+from fom.db import BASE_URL
+from django_fluidinfo.session import (LazyFluid, bind_lazily,
+    fluid_from_settings)
+from standin import StandInServer
+from management.commands.loadtestfluidinfo import percentile
 fluid = sandbox_fluid()
 fluid.login('test', 'test')
 
@@ -100,6 +111,145 @@ class ModelTest(unittest.TestCase):
         self.assertEqual(m.description, twin.description)
         self.assertEqual(m.timestamp, twin.timestamp)
 
+    def test_in_bulk(self):
+        """
+        Make sure we can load several objects and their fields with a single
+        call, keyed by either uid or about tag value
+        """
+        abouts = ["django_fluidinfo bulk test object %d" % i for i in range(3)]
+        uids = []
+        for i, about in enumerate(abouts):
+            m = Meeting(about=about)
+            m.description = "bulk description %d" % i
+            m.timestamp = i
+            m.save()
+            uids.append(m.uid)
+        by_uid = Meeting.in_bulk(uids)
+        self.assertEqual(sorted(uids), sorted(by_uid.keys()))
+        for i, uid in enumerate(uids):
+            self.assertEqual(True, isinstance(by_uid[uid], Meeting))
+            self.assertEqual("bulk description %d" % i,
+                by_uid[uid].get_cached('test/description'))
+            self.assertEqual(i, by_uid[uid].get_cached('test/timestamp'))
+        by_about = Meeting.in_bulk_about(abouts + ["no such object"])
+        self.assertEqual(sorted(abouts), sorted(by_about.keys()))
+        for i, about in enumerate(abouts):
+            self.assertEqual(uids[i], by_about[about].uid)
+            self.assertEqual(i, by_about[about].timestamp)
+        self.assertEqual({}, Meeting.in_bulk([]))
+
+    def test_aggregate(self):
+        """
+        Make sure aggregates are calculated over the objects matching a query
+        """
+        for i in range(3):
+            m = Meeting(about="django_fluidinfo aggregate test object %d" % i)
+            m.description = "aggregate description"
+            m.timestamp = 10 + i
+            m.save()
+        # Fluidinfo tags can hold null, which the aggregates should ignore
+        m = Meeting(about="django_fluidinfo aggregate test null object")
+        m.description = "aggregate description"
+        m.timestamp = None
+        m.save()
+        query = 'test/description = "aggregate description"'
+        result = Meeting.filter(query).aggregate(count=models.Count(),
+            timestamps=models.Count('timestamp'),
+            first=models.Min('timestamp'), last=models.Max('timestamp'),
+            total=models.Sum('timestamp'),
+            spread=models.Histogram('timestamp', bucket=2))
+        self.assertEqual(4, result['count'])
+        self.assertEqual(3, result['timestamps'])
+        self.assertEqual(10, result['first'])
+        self.assertEqual(12, result['last'])
+        self.assertEqual(33, result['total'])
+        self.assertEqual({10: 2, 12: 1}, result['spread'])
+        self.assertEqual({'count': 4},
+            Meeting.filter(query).aggregate(count=models.Count()))
+        self.assertEqual({'last': None},
+            Meeting.filter('test/timestamp > 999999999').aggregate(
+                last=models.Max('timestamp')))
+        self.assertRaises(ValueError, Meeting.filter(query).aggregate,
+            foo=models.Max('foo'))
+        self.assertRaises(ValueError, Meeting.filter(query).cache, 0)
+
+    def test_filter_result_type(self):
+        """
+        Make sure filter still honours FOM's result_type argument
+        """
+        m = Meeting(about="django_fluidinfo result_type test object")
+        m.description = "result_type description"
+        m.timestamp = 1
+        m.save()
+        query = 'test/description = "result_type description"'
+        results = list(models.Model.filter(query, result_type=Meeting))
+        self.assertEqual([m.uid], [x.uid for x in results])
+        self.assertEqual(True, isinstance(results[0], Meeting))
+        results = Meeting.filter(query, result_type=Object)
+        self.assertEqual([m.uid], [x.uid for x in results])
+        self.assertEqual(False, isinstance(results[0], Meeting))
+
+    def test_model_inheritance(self):
+        """
+        Make sure fields are listed in the order they're declared and that
+        fields declared on parent models are inherited
+        """
+        class Appointment(Meeting):
+            where = models.CharField('test/where')
+            attendees = models.IntegerField('test/attendees')
+            about_me = models.CharField('test/about_me')
+
+        self.assertEqual(['description', 'timestamp', 'where', 'attendees',
+            'about_me'], Appointment.ordered_fields)
+        self.assertEqual(Meeting.fields['timestamp'],
+            Appointment.fields['timestamp'])
+        self.assertEqual(['description', 'timestamp'], Meeting.ordered_fields)
+
+        class AppointmentForm(forms.ModelForm):
+            class Meta:
+                model = Appointment
+
+        self.assertEqual(Appointment.ordered_fields,
+            AppointmentForm.base_fields.keys())
+
+    def test_form_classes_do_not_share_fields(self):
+        """
+        Make sure changing a form class's fields doesn't affect another form
+        class for the same model
+        """
+        class FirstForm(forms.ModelForm):
+            class Meta:
+                model = Meeting
+
+        class SecondForm(forms.ModelForm):
+            class Meta:
+                model = Meeting
+
+        FirstForm.base_fields['description'].required = False
+        FirstForm.base_fields['description'].label = 'Changed'
+        self.assertEqual(True, SecondForm.base_fields['description'].required)
+        self.assertEqual(None, SecondForm.base_fields['description'].label)
+        self.assertEqual(True, MeetingForm.base_fields['description'].required)
+        self.assertEqual(False, 'Changed' in SecondForm().as_p())
+        self.assertEqual(True, isinstance(
+            SecondForm.base_fields['timestamp'], django_forms.IntegerField))
+
+    def test_lazy_session(self):
+        """
+        Make sure a lazy session is only created when it's first used
+        """
+        created = []
+
+        def factory():
+            created.append(Fluid())
+            return created[-1]
+
+        lazy = LazyFluid(factory)
+        self.assertEqual([], created)
+        self.assertEqual(True, lazy.objects is not None)
+        self.assertEqual(True, lazy.db is created[0].db)
+        self.assertEqual(1, len(created))
+
     def test_field_types(self):
         """
         Just like Django we provide fields types (but these map to Fluidinfo's
@@ -176,5 +326,176 @@ class ModelTest(unittest.TestCase):
         self.assertEqual(False, f.is_valid())
         self.assertEqual(True, f.errors['__all__'] == [u'form foo!'])
 
+
+class SessionTest(unittest.TestCase):
+    SETTINGS = ('FLUIDINFO_URL', 'FLUIDINFO_USERNAME', 'FLUIDINFO_PASSWORD')
+
+    def setUp(self):
+        self.previous = Fluid.bound
+        self.previous_settings = dict((name, getattr(settings, name))
+            for name in self.SETTINGS if hasattr(settings, name))
+
+    def tearDown(self):
+        Fluid.bound = self.previous
+        for name in self.SETTINGS:
+            if name in self.previous_settings:
+                setattr(settings, name, self.previous_settings[name])
+            elif hasattr(settings, name):
+                delattr(settings, name)
+
+    def configure(self, **values):
+        """
+        Replaces the Fluidinfo settings with the given values
+        """
+        for name in self.SETTINGS:
+            if name in values:
+                setattr(settings, name, values[name])
+            elif hasattr(settings, name):
+                delattr(settings, name)
+
+    def test_bind_lazily(self):
+        """
+        Make sure a lazy session is only bound if no session is bound already
+        """
+        fluid = Fluid()
+        fluid.bind()
+        bind_lazily()
+        self.assertEqual(True, Fluid.bound is fluid)
+        Fluid.bound = None
+        bind_lazily()
+        self.assertEqual(True, isinstance(Fluid.bound, LazyFluid))
+        self.assertEqual(None, Fluid.bound._fluid)
+
+    def test_models_import_binds_lazily(self):
+        """
+        Make sure importing the models module binds a lazy session (without
+        creating the real one) unless a session is already bound
+        """
+        path = os.path.splitext(models.__file__)[0] + '.py'
+        Fluid.bound = None
+        imp.load_source('django_fluidinfo_models_copy', path)
+        self.assertEqual(True, isinstance(Fluid.bound, LazyFluid))
+        self.assertEqual(None, Fluid.bound._fluid)
+        fluid = Fluid()
+        fluid.bind()
+        imp.load_source('django_fluidinfo_models_copy', path)
+        self.assertEqual(True, Fluid.bound is fluid)
+
+    def test_fluid_from_settings(self):
+        """
+        Make sure the session is created for the Fluidinfo instance and
+        credentials in the settings
+        """
+        self.configure(FLUIDINFO_URL='http://localhost:8000',
+            FLUIDINFO_USERNAME='username', FLUIDINFO_PASSWORD='password')
+        fluid = fluid_from_settings()
+        self.assertEqual('http://localhost:8000', fluid.db.base_url)
+        self.assertEqual('Basic ' + 'username:password'.encode('base64').strip(),
+            fluid.db.headers['Authorization'])
+        # the main instance is used by default and logging in is optional
+        self.configure()
+        fluid = fluid_from_settings()
+        self.assertEqual(BASE_URL, fluid.db.base_url)
+        self.assertEqual(False, 'Authorization' in fluid.db.headers)
+        # the settings are only read when the lazy session is first used
+        lazy = LazyFluid()
+        self.configure(FLUIDINFO_URL='http://localhost:8001')
+        self.assertEqual('http://localhost:8001', lazy.db.base_url)
+
+
+class LoadTestTest(unittest.TestCase):
+    def setUp(self):
+        self.server = StandInServer()
+        self.server.start()
+        self.previous = Fluid.bound
+        Fluid(self.server.url).bind()
+
+    def tearDown(self):
+        Fluid.bound = self.previous
+        self.server.stop()
+
+    def test_stand_in(self):
+        """
+        Make sure models work against the stand-in and that it counts the
+        requests made to it
+        """
+        m = Meeting(about="django_fluidinfo stand-in object")
+        m.description = "stand-in"
+        m.timestamp = 42
+        m.save()
+        self.assertEqual(2, self.server.requests)
+        twin = Meeting(m.uid)
+        self.assertEqual(42, twin.timestamp)
+        self.assertEqual([m.uid],
+            [x.uid for x in Meeting.filter('test/timestamp > 40')])
+        self.assertEqual(4, self.server.requests)
+
+    def test_command(self):
+        """
+        Make sure the load test command runs every scenario without errors
+        """
+        output = StringIO()
+        # a single object so each thread submits the form for it repeatedly
+        call_command('loadtestfluidinfo', threads=2, iterations=3, latency=0,
+            objects=1, page_size=1, stdout=output)
+        rows = [line.split() for line in output.getvalue().splitlines()[1:]]
+        self.assertEqual(['render', 'submit', 'filter'],
+            [row[0] for row in rows])
+        for row in rows:
+            # 2 threads x 3 iterations and no errors
+            self.assertEqual(['6', '0'], row[1:3])
+        # the session bound before the command ran is restored
+        self.assertEqual(self.server.url, Fluid.bound.db.base_url)
+
+    def test_in_bulk_batches(self):
+        """
+        Make sure in_bulk splits large numbers of uids into several queries
+        """
+        uids = []
+        for i in range(250):
+            uid = self.server.create_object("bulk batch object %d" % i)
+            self.server.set_value(uid, 'test/timestamp', i)
+            uids.append(uid)
+        result = Meeting.in_bulk(uids + ['no-such-uid'])
+        # 251 uids in batches of 100
+        self.assertEqual(3, self.server.requests)
+        self.assertEqual(sorted(uids), sorted(result.keys()))
+        self.assertEqual(249, result[uids[249]].timestamp)
+        abouts = ["bulk batch object %d" % i for i in range(150)]
+        result = Meeting.in_bulk_about(abouts)
+        self.assertEqual(5, self.server.requests)
+        self.assertEqual(sorted(abouts), sorted(result.keys()))
+        self.assertEqual({}, Meeting.in_bulk([]))
+        self.assertEqual(5, self.server.requests)
+
+    def test_filter(self):
+        """
+        Make sure filter works for Model itself and that its results can be
+        used like the list it used to return
+        """
+        m = Meeting(about="django_fluidinfo filter object")
+        m.timestamp = 7
+        m.save()
+        results = models.Model.filter('has test/timestamp')
+        self.assertEqual([m.uid], [x.uid for x in results])
+        self.assertEqual(True, isinstance(results[0], models.Model))
+        results = Meeting.filter('has test/timestamp')
+        self.assertEqual([m], results)
+        self.assertEqual(False, results != [m])
+        self.assertEqual([m, m], results + [m])
+        self.assertEqual([m, m], [m] + results)
+        self.assertEqual(7, results[0].timestamp)
+
+    def test_percentile(self):
+        """
+        Make sure percentiles are calculated by nearest rank
+        """
+        values = range(1, 101)
+        self.assertEqual(50, percentile(values, 50))
+        self.assertEqual(95, percentile(values, 95))
+        self.assertEqual(99, percentile(values, 99))
+        self.assertEqual(7, percentile([7], 99))
+        self.assertEqual(0, percentile([], 50))
+
 if __name__ == '__main__':
     unittest.main()
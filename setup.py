@@ -5,7 +5,8 @@ setup(
     author='Nicholas Tollervey',
     author_email='dev@fluidinfo.com',
     version='0.2.0',
-    packages=['django_fluidinfo'],
+    packages=['django_fluidinfo', 'django_fluidinfo.management',
+        'django_fluidinfo.management.commands'],
     url='http://fluidinfo.com/',
     license='LICENSE.txt',
     description='Provides a familiar interface for using Fluidinfo within Django projects',